@@ -0,0 +1,32 @@
+# cython: language_level=3
+# Compiled twin of vidp_alert._scan_text_for_callsigns. Keep the two in sync;
+# vidp_alert falls back to the pure-Python version when this isn't built.
+from bisect import bisect_right
+from itertools import accumulate
+
+try:
+    import re2 as re  # google-re2: linear-time engine, faster bulk scans
+except ImportError:
+    import re
+
+# inline (?i) rather than flag args: google-re2's compile() doesn't
+# accept stdlib flag constants
+PATTERN_CALLSIGN = re.compile(r"(?i)\b([A-Z]{2,3}\d{1,4}[A-Z]?)\b")
+PATTERN_VIDP = re.compile(r"(?i)\bVIDP\b")
+
+
+def scan_text_for_callsigns(str text):
+    cdef set callsigns = set()
+    cdef list lines = text.splitlines()
+    cdef int n = len(lines)
+    cdef int i, start, end
+    cdef str window, c
+    cdef list line_starts = list(accumulate((len(l) + 1 for l in lines), initial=0))
+    for m in PATTERN_VIDP.finditer(text):
+        i = bisect_right(line_starts, m.start()) - 1
+        start = max(0, i - 2)
+        end = min(n, i + 3)
+        window = " ".join(lines[start:end])
+        for c in PATTERN_CALLSIGN.findall(window):
+            callsigns.add(c.upper())
+    return callsigns
@@ -0,0 +1,18 @@
+# Builds the optional Cython accelerator for the callsign scan:
+#   pip install cython && python setup.py build_ext --inplace
+# vidp_alert.py works without it (pure-Python fallback).
+from setuptools import Extension, setup
+from Cython.Build import cythonize
+
+extensions = [
+    Extension(
+        "_callsign_scan",
+        ["_callsign_scan.pyx"],
+        extra_compile_args=["-O3", "-march=native"],
+    ),
+]
+
+setup(
+    name="catfm-vidp-alert",
+    ext_modules=cythonize(extensions, compiler_directives={"language_level": "3"}),
+)
@@ -1,13 +1,24 @@
+import asyncio
+import bisect
+import concurrent.futures
+import hashlib
+import itertools
 import os
-import re
 import requests
 import json
 import smtplib
+from contextlib import contextmanager
+
+import aiohttp
 from email.mime.text import MIMEText
 from bs4 import BeautifulSoup
-from io import BytesIO
 import fitz  # PyMuPDF
 
+try:
+    import re2 as re  # google-re2: linear-time engine, faster bulk scans
+except ImportError:
+    import re
+
 # ------- CONFIGURATION --------
 LIST_URL = "https://www.atfmaai.aero/portal/en/news/atfm-measures"
 SEEN_FILE = "seen.json"
@@ -19,111 +30,271 @@ EMAIL_PASSWORD = os.environ.get("EMAIL_PASSWORD")
 EMAIL_TO = os.environ.get("EMAIL_TO")
 
 PDF_DOWNLOAD_TIMEOUT = 30  # seconds
+MAX_CONCURRENT_DOWNLOADS = 8  # be polite to the server
 
-# Regexes
-PATTERN_CALLSIGN = re.compile(r"\b([A-Z]{2,3}\d{1,4}[A-Z]?)\b")
-PATTERN_VIDP = re.compile(r"\bVIDP\b", re.IGNORECASE)
+# Regexes — inline (?i) rather than flag args: google-re2's compile()
+# doesn't accept stdlib flag constants
+PATTERN_CALLSIGN = re.compile(r"(?i)\b([A-Z]{2,3}\d{1,4}[A-Z]?)\b")
+PATTERN_VIDP = re.compile(r"(?i)\bVIDP\b")
+# any text-showing operator (Tj, TJ, ' or ") makes a stream opaque to a
+# substring scan: operands may be hex-encoded, case-mixed, split across
+# show operators or mapped to CID glyph indices, so only a stream that
+# draws no text at all is provably VIDP-free
+PATTERN_TEXT_SHOW = re.compile(rb"\bT[jJ]\b|['\"]")
+
+# One keep-alive session for the sync (listing) side; the async PDF
+# downloads already share an aiohttp.ClientSession per run.
+SESSION = requests.Session()
+SESSION.headers["User-Agent"] = USER_AGENT
 
 # -------- Helpers --------
+try:
+    import orjson  # Rust-backed JSON — markedly faster load/save
+
+    def _read_json(path):
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+
+    def _write_json(path, obj):
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+except ImportError:
+    def _read_json(path):
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _write_json(path, obj):
+        with open(path, "w") as f:
+            json.dump(obj, f, indent=2, sort_keys=True)
+
 def load_seen():
+    # {"pdfs": {url: {"sha256", "etag", "last_modified", "callsigns"}},
+    #  "listing": {"etag", "last_modified"}}
     if os.path.exists(SEEN_FILE):
         try:
-            with open(SEEN_FILE, "r") as f:
-                return set(json.load(f))
+            data = _read_json(SEEN_FILE)
         except Exception:
-            return set()
-    return set()
+            return {"pdfs": {}}
+        if isinstance(data, list):
+            # migrate legacy format (bare list of URLs)
+            return {"pdfs": {url: {} for url in data}}
+        return data
+    return {"pdfs": {}}
 
 def save_seen(seen):
-    with open(SEEN_FILE, "w") as f:
-        json.dump(sorted(list(seen)), f, indent=2)
+    _write_json(SEEN_FILE, seen)
 
-def send_email(subject, body):
-    if not EMAIL_USERNAME or not EMAIL_PASSWORD or not EMAIL_TO:
-        print("Missing email credentials — cannot send.")
-        return False
-    msg = MIMEText(body, "plain")
-    msg["From"] = EMAIL_USERNAME
-    msg["To"] = EMAIL_TO
-    msg["Subject"] = subject
+@contextmanager
+def smtp_session():
+    # one authenticated connection, reusable across multiple sends
+    s = smtplib.SMTP("smtp.gmail.com", 587, timeout=60)
     try:
-        s = smtplib.SMTP("smtp.gmail.com", 587, timeout=60)
+        s.ehlo()
         s.starttls()
         s.login(EMAIL_USERNAME, EMAIL_PASSWORD)
-        s.send_message(msg)
+        yield s
+    finally:
         s.quit()
-        print("Email sent:", subject)
-        return True
-    except Exception as e:
-        print("Error sending email:", e)
-        return False
 
-def find_pdf_links():
-    headers = {"User-Agent": USER_AGENT}
-    r = requests.get(LIST_URL, headers=headers, timeout=20)
+def send_email(s, subject, body):
+    msg = MIMEText(body, "plain")
+    msg["From"] = EMAIL_USERNAME
+    msg["To"] = EMAIL_TO
+    msg["Subject"] = subject
+    s.send_message(msg)
+    print("Email sent:", subject)
+
+def find_pdf_links(listing_meta):
+    # revalidate the listing page — a 304 means no body and no parse
+    headers = {}
+    if listing_meta.get("etag"):
+        headers["If-None-Match"] = listing_meta["etag"]
+    if listing_meta.get("last_modified"):
+        headers["If-Modified-Since"] = listing_meta["last_modified"]
+    r = SESSION.get(LIST_URL, headers=headers, timeout=20)
+    if r.status_code == 304:
+        print("Listing unchanged — nothing new.")
+        return []
     r.raise_for_status()
-    soup = BeautifulSoup(r.text, "html.parser")
+    for key, header in (("etag", "ETag"), ("last_modified", "Last-Modified")):
+        value = r.headers.get(header)
+        if value:
+            listing_meta[key] = value
+    soup = BeautifulSoup(r.text, "lxml")
     links = []
-    for a in soup.find_all("a", href=True):
+    # the selector filters for PDF hrefs inside the C layer
+    for a in soup.select('a[href$=".pdf" i]'):
         href = a["href"].strip()
-        # Check if link is PDF
-        if href.lower().endswith(".pdf"):
-            if href.startswith("/"):
-                href = "https://www.atfmaai.aero" + href
-            links.append(href)
-    # dedupe in order
-    seen = set()
-    ordered = []
-    for l in links:
-        if l not in seen:
-            seen.add(l)
-            ordered.append(l)
-    return ordered
+        if href.startswith("/"):
+            href = "https://www.atfmaai.aero" + href
+        links.append(href)
+    # dedupe in order (dicts preserve insertion order)
+    return list(dict.fromkeys(links))
+
+def pdf_mentions_vidp(doc, pdf_bytes):
+    # bytes.find runs memmem over the raw download — a hit is a cheap
+    # accept, but a miss proves nothing (text is routinely hex-encoded,
+    # TJ-split or mapped to CID glyph indices)
+    if pdf_bytes.find(b"VIDP") >= 0 or pdf_bytes.find(b"vidp") >= 0:
+        return True
+    # walk the decompressed streams; skip extraction only when no stream
+    # draws any text at all (e.g. image-only scans)
+    for xref in range(1, doc.xref_length()):
+        try:
+            if not doc.xref_is_stream(xref):
+                continue
+            stream = doc.xref_stream(xref)
+        except Exception:
+            return True  # can't inspect — assume a mention, parse normally
+        if not stream:
+            continue
+        if b"VIDP" in stream or b"vidp" in stream:
+            return True
+        if PATTERN_TEXT_SHOW.search(stream):
+            return True  # stream shows text — can't prove absence
+    return False
+
+def _scan_text_for_callsigns(text):
+    callsigns = set()
+    lines = text.splitlines()
+    # one regex pass over the whole text; map match offsets back
+    # to line numbers instead of scanning line by line in Python
+    line_starts = list(itertools.accumulate((len(l) + 1 for l in lines), initial=0))
+    for m in PATTERN_VIDP.finditer(text):
+        i = bisect.bisect_right(line_starts, m.start()) - 1
+        # build small context window
+        start = max(0, i - 2)
+        end = min(len(lines), i + 3)
+        window = " ".join(lines[start:end])
+        for c in PATTERN_CALLSIGN.findall(window):
+            # normalise only the short matches, not whole lines
+            callsigns.add(c.upper())
+    return callsigns
+
+try:
+    # compiled twin of _scan_text_for_callsigns — build with `python setup.py build_ext --inplace`
+    from _callsign_scan import scan_text_for_callsigns
+except ImportError:
+    scan_text_for_callsigns = _scan_text_for_callsigns
 
 def extract_callsigns_from_pdf_bytes(pdf_bytes):
     callsigns = set()
-    with fitz.open(stream=BytesIO(pdf_bytes), filetype="pdf") as doc:
-        for page in doc:
-            text = page.get_text("text")
-            lines = text.splitlines()
-            for i, line in enumerate(lines):
-                if PATTERN_VIDP.search(line):
-                    # build small context window
-                    start = max(0, i - 2)
-                    end = min(len(lines), i + 3)
-                    window = " ".join(lines[start:end])
-                    for m in PATTERN_CALLSIGN.findall(window):
-                        callsigns.add(m)
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        # most ATFM PDFs never mention VIDP — skip extraction entirely
+        if not pdf_mentions_vidp(doc, pdf_bytes):
+            return []
+        n_pages = doc.page_count
+        if n_pages <= 1:
+            texts = [page.get_text("text") for page in doc]
+        else:
+            # get_text releases the GIL in the C layer, so threads genuinely
+            # overlap; fitz.Document isn't thread-safe, so each worker opens
+            # its own handle and takes an interleaved slice of the pages
+            workers = min(4, n_pages)
+
+            def pages_text(page_numbers):
+                with fitz.open(stream=pdf_bytes, filetype="pdf") as d:
+                    return [(i, d.load_page(i).get_text("text")) for i in page_numbers]
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+                results = ex.map(pages_text, (range(k, n_pages, workers)
+                                              for k in range(workers)))
+            texts = [t for _, t in sorted(itertools.chain.from_iterable(results))]
+        # one regex-engine entry per document, not per page; the sentinel
+        # line keeps tokens from gluing together across page boundaries
+        callsigns |= scan_text_for_callsigns("\n\x00\n".join(texts))
     return list(callsigns)
 
+async def fetch_pdf(session, sem, url, entry):
+    # revalidate known PDFs instead of re-downloading them
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    async with sem:
+        print("Fetching PDF:", url)
+        try:
+            async with session.get(url, headers=headers,
+                                   timeout=aiohttp.ClientTimeout(total=PDF_DOWNLOAD_TIMEOUT)) as r:
+                if r.status == 304:  # unchanged upstream — no body sent
+                    return url, None, None, None
+                r.raise_for_status()
+                meta = {k: v for k, v in (("etag", r.headers.get("ETag")),
+                                          ("last_modified", r.headers.get("Last-Modified"))) if v}
+                # read in chunks, hashing as we go
+                digest = hashlib.sha256()
+                buf = bytearray()
+                async for chunk in r.content.iter_chunked(64 * 1024):
+                    buf.extend(chunk)
+                    digest.update(chunk)
+                return url, bytes(buf), digest.hexdigest(), meta
+        except Exception as e:
+            print("Failed download:", e)
+            return url, None, None, None
+
+async def download_pdfs(urls, cache):
+    sem = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    headers = {"User-Agent": USER_AGENT}
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(fetch_pdf(session, sem, url, cache.get(url, {})))
+                     for url in urls]
+    # drop 304s and failed downloads — failures are retried next run
+    return [result for result in (t.result() for t in tasks) if result[1] is not None]
+
 def process_new_pdfs():
     seen = load_seen()
-    new_seen = set(seen)
+    cache = seen["pdfs"]
     alerts = []
 
-    pdfs = find_pdf_links()
-    print("Found PDF links:", len(pdfs))
-    for url in pdfs:
-        if url in seen:
-            continue
-        print("Downloading PDF:", url)
-        try:
-            r = requests.get(url, timeout=PDF_DOWNLOAD_TIMEOUT)
-            r.raise_for_status()
-        except Exception as e:
-            print("Failed download:", e)
-            continue
+    pdfs = find_pdf_links(seen.setdefault("listing", {}))
+    # single-pass split, preserving listing order: brand-new URLs are
+    # dispatched first, known ones only get revalidated after
+    new_urls = [u for u in pdfs if u not in cache]
+    known_urls = [u for u in pdfs if u in cache]
+    preexisting = set(known_urls)
+    print("Found PDF links:", len(pdfs), "new:", len(new_urls))
 
-        calls = extract_callsigns_from_pdf_bytes(r.content)
-        if calls:
-            alerts.append((url, calls))
-            print("VIDP callsigns found:", calls)
-        else:
-            print("No VIDP in this PDF.")
+    # without validators a "revalidation" is just a full re-download on
+    # every run — if we already hold the body's hash, skip the fetch
+    # entirely (baseline behaviour) and be polite to the server
+    revalidate = [u for u in known_urls
+                  if cache[u].get("etag") or cache[u].get("last_modified")
+                  or not cache[u].get("sha256")]
+
+    downloads = asyncio.run(download_pdfs(new_urls + revalidate, cache))
+
+    # only re-parse bodies whose content actually changed
+    to_parse = []
+    for url, pdf_bytes, digest, meta in downloads:
+        entry = cache.setdefault(url, {})
+        entry.update(meta)
+        if entry.get("sha256") == digest:
+            continue
+        entry["sha256"] = digest
+        to_parse.append((url, pdf_bytes))
 
-        new_seen.add(url)
+    # Each PDF parses independently — fan the CPU-bound extraction across cores
+    with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = executor.map(extract_callsigns_from_pdf_bytes,
+                               (pdf_bytes for _, pdf_bytes in to_parse))
+        for (url, _), calls in zip(to_parse, results):
+            entry = cache[url]
+            previous = entry.get("callsigns")
+            entry["callsigns"] = sorted(calls)
+            if previous is None and url in preexisting:
+                # entry migrated from the legacy URL-list format: the PDF
+                # was already handled before callsigns were cached, so
+                # record them silently rather than re-alerting
+                continue
+            if calls and entry["callsigns"] != previous:
+                alerts.append((url, calls))
+                print("VIDP callsigns found:", calls)
+            else:
+                print("No VIDP in this PDF.")
 
-    save_seen(new_seen)
+    save_seen(seen)
     return alerts
 
 def main():
@@ -142,7 +313,14 @@ def main():
 
     subject = f"VIDP ATFM Alert — {len(alerts)} file(s) with matches"
     body = "\n".join(body_lines)
-    send_email(subject, body)
+    if not EMAIL_USERNAME or not EMAIL_PASSWORD or not EMAIL_TO:
+        print("Missing email credentials — cannot send.")
+        return
+    try:
+        with smtp_session() as s:
+            send_email(s, subject, body)
+    except Exception as e:
+        print("Error sending email:", e)
 
 if __name__ == "__main__":
     main()